@@ -0,0 +1,26 @@
+"""add_redirect_code
+
+Revision ID: 5b2f0c7e9a41
+Revises: cddcd92ddaf1
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2f0c7e9a41'
+down_revision: Union[str, None] = 'cddcd92ddaf1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('links', sa.Column('redirect_code', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('links', 'redirect_code')
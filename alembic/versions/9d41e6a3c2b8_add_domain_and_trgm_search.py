@@ -0,0 +1,135 @@
+"""add_domain_and_trgm_search
+
+Revision ID: 9d41e6a3c2b8
+Revises: 5b2f0c7e9a41
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+from urllib.parse import urlsplit
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d41e6a3c2b8'
+down_revision: Union[str, None] = '5b2f0c7e9a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BATCH_SIZE = 10000
+
+
+def _extract_domain(url: str) -> str | None:
+    # Копия src.router._extract_domain на момент миграции: ревизия не должна
+    # зависеть от того, как код приложения изменится позже
+    try:
+        host = urlsplit(url if "://" in url else f"//{url}").hostname
+    except ValueError:
+        return None
+    if not host:
+        return None
+    return host[4:] if host.startswith("www.") else host
+
+
+links = sa.table(
+    'links',
+    sa.column('id', sa.Integer),
+    sa.column('url', sa.String),
+    sa.column('domain', sa.String),
+    sa.column('cnt_usage', sa.Integer)
+)
+
+
+def _backfill(bind) -> None:
+    # Домен заполняется той же функцией, что и при создании ссылки, пачками по id.
+    # Каждая пачка - один UPDATE ... FROM (VALUES ...) в своей транзакции, поэтому
+    # блокируются только строки пачки и только на время ее обновления
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(links.c.id, links.c.url)
+            .where(links.c.id > last_id)
+            .order_by(links.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+
+        batch = sa.values(sa.column('id', sa.Integer), sa.column('domain', sa.String), name='batch').data(
+            [(link_id, _extract_domain(url)) for link_id, url in rows]
+        )
+        bind.execute(
+            sa.update(links)
+            .where(links.c.id == batch.c.id)
+            .values(domain=batch.c.domain, cnt_usage=sa.func.coalesce(links.c.cnt_usage, 0))
+        )
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    # DDL ждет ACCESS EXCLUSIVE не дольше lock_timeout, а не копит за собой очередь запросов
+    op.execute("SET lock_timeout = '5s'")
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Nullable-колонка и значение по умолчанию меняют только каталог; эта короткая
+    # транзакция коммитится при входе в autocommit_block
+    op.add_column('links', sa.Column('domain', sa.String(), nullable=True))
+    op.alter_column('links', 'cnt_usage', existing_type=sa.Integer(), server_default='0')
+
+    # Дальше каждая команда коммитится сама, и миграция не держит блокировку таблицы
+    with op.get_context().autocommit_block():
+        _backfill(op.get_bind())
+
+        # Сортировка поиска по числу переходов идет по индексу, поэтому NULL не допускается.
+        # VALIDATE проверяет строки без блокировки записи, а SET NOT NULL использует
+        # проверенное ограничение и не сканирует таблицу
+        op.execute(
+            'ALTER TABLE links ADD CONSTRAINT ck_links_cnt_usage_not_null '
+            'CHECK (cnt_usage IS NOT NULL) NOT VALID'
+        )
+        op.execute('ALTER TABLE links VALIDATE CONSTRAINT ck_links_cnt_usage_not_null')
+        op.alter_column('links', 'cnt_usage', existing_type=sa.Integer(), nullable=False)
+        op.drop_constraint('ck_links_cnt_usage_not_null', 'links', type_='check')
+
+        # CONCURRENTLY: чтение и запись в таблицу продолжаются, пока строятся индексы.
+        # Построение ждет завершения уже идущих транзакций, и lock_timeout здесь
+        # оставил бы недостроенный (INVALID) индекс
+        op.execute('RESET lock_timeout')
+        op.create_index(
+            'ix_links_clicks', 'links',
+            [sa.text('cnt_usage DESC'), sa.text('id DESC')],
+            unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_links_domain_clicks', 'links',
+            ['domain', sa.text('cnt_usage DESC'), sa.text('id DESC')],
+            unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_links_project_clicks', 'links',
+            ['project_id', sa.text('cnt_usage DESC'), sa.text('id DESC')],
+            unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_links_domain_reversed', 'links',
+            [sa.text('reverse(domain) text_pattern_ops')],
+            unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_links_url_trgm', 'links', ['url'],
+            unique=False, postgresql_using='gin',
+            postgresql_ops={'url': 'gin_trgm_ops'},
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_links_url_trgm', table_name='links')
+    op.drop_index('ix_links_domain_reversed', table_name='links')
+    op.drop_index('ix_links_project_clicks', table_name='links')
+    op.drop_index('ix_links_domain_clicks', table_name='links')
+    op.drop_index('ix_links_clicks', table_name='links')
+    op.alter_column('links', 'cnt_usage', existing_type=sa.Integer(), nullable=True, server_default=None)
+    op.drop_column('links', 'domain')
@@ -0,0 +1,381 @@
+"""Микробенчмарки горячих путей роутеров и фоновых задач без docker-compose.
+
+Приложение вызывается в процессе через ASGI-транспорт httpx, задачи Celery и
+embedded-режима - напрямую. Postgres поднимается во временном каталоге через
+initdb/pg_ctl (нужны бинарники Postgres с contrib в PATH и запуск не от root),
+либо берется готовая пустая база из BENCH_DATABASE_URL. Redis заменяется
+fakeredis в памяти процесса.
+
+    pip install -r requirements.txt -r benchmarks/requirements.txt
+    python -m benchmarks.run --size 10000 --iterations 200
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json --threshold 0.2
+
+Для каждого сценария выводятся ops/sec, задержка одного вызова (среднее, p50,
+p95, p99) и пик выделенной за вызов памяти (tracemalloc, отдельным проходом,
+чтобы трассировка не искажала задержки).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "src")]
+
+
+class EphemeralPostgres:
+    def __init__(self):
+        self.tmp = tempfile.mkdtemp(prefix="bench-pg-")
+        self.data = os.path.join(self.tmp, "data")
+        self.port = None
+
+    def start(self) -> dict:
+        if shutil.which("initdb") is None or shutil.which("pg_ctl") is None:
+            raise SystemExit("initdb/pg_ctl not found in PATH; install Postgres or set BENCH_DATABASE_URL")
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+
+        subprocess.run(
+            ["initdb", "-D", self.data, "-U", "bench", "--auth=trust"],
+            check=True, capture_output=True
+        )
+        subprocess.run(
+            [
+                "pg_ctl", "-D", self.data, "-w", "start",
+                "-l", os.path.join(self.tmp, "postgres.log"),
+                "-o", f"-p {self.port} -k {self.tmp} -c listen_addresses=127.0.0.1 -c fsync=off"
+            ],
+            check=True, capture_output=True
+        )
+        subprocess.run(
+            ["createdb", "-h", "127.0.0.1", "-p", str(self.port), "-U", "bench", "bench"],
+            check=True, capture_output=True
+        )
+        return {
+            "DB_USER": "bench", "DB_PASS": "bench", "DB_HOST": "127.0.0.1",
+            "DB_PORT": str(self.port), "DB_NAME": "bench"
+        }
+
+    def stop(self):
+        if self.port is not None:
+            subprocess.run(["pg_ctl", "-D", self.data, "-m", "fast", "stop"], capture_output=True)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+def env_from_url(url: str) -> dict:
+    from sqlalchemy.engine import make_url
+
+    parsed = make_url(url)
+    return {
+        "DB_USER": parsed.username or "", "DB_PASS": parsed.password or "",
+        "DB_HOST": parsed.host or "127.0.0.1", "DB_PORT": str(parsed.port or 5432),
+        "DB_NAME": parsed.database or ""
+    }
+
+
+def seed(size: int, run_id: str) -> None:
+    from sqlalchemy import text
+    from src.models import Base, Link, Project
+    from src.tasks.tasks import engine
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    Base.metadata.create_all(engine)
+
+    now = datetime.utcnow() + timedelta(hours=3)
+    with engine.begin() as conn:
+        project_ids = conn.execute(
+            Project.__table__.insert().returning(Project.id),
+            [{"name": f"{run_id}-p{i}", "started_at": now} for i in range(10)]
+        ).scalars().all()
+
+        rows = [
+            {
+                "url": f"https://site{i % 100}.example.com/page/{i}",
+                "domain": f"site{i % 100}.example.com",
+                "short": f"{run_id}{i}",
+                "created_at": now,
+                # Не больше 10 переходов, чтобы обычные ссылки не попадали в кэш
+                "cnt_usage": i % 10,
+                "expires_at": now + timedelta(days=1) if i % 5 == 0 else None,
+                "project_id": project_ids[i % len(project_ids)],
+                "deleted": False,
+                "redirect_code": 307
+            }
+            for i in range(size)
+        ]
+        rows.append({**rows[0], "short": f"{run_id}hot", "cnt_usage": 1000, "expires_at": None})
+        for i in range(0, len(rows), 5000):
+            conn.execute(Link.__table__.insert(), rows[i:i + 5000])
+        conn.execute(text("ANALYZE links"))
+
+
+@dataclass
+class Scenario:
+    name: str
+    call: Callable[[int], Awaitable]
+    setup: Callable[[int], Awaitable] | None = None
+
+
+def build_scenarios(client, fake_server, size: int, run_id: str) -> list[Scenario]:
+    import fakeredis
+    from src.tasks import tasks, embedded
+
+    sync_redis = fakeredis.FakeRedis(server=fake_server)
+    hot = f"{run_id}hot"
+
+    def code(i):
+        return f"{run_id}{i % size}"
+
+    async def expect(response, *statuses):
+        if response.status_code not in statuses:
+            raise RuntimeError(f"{response.request.url}: {response.status_code} {response.text}")
+
+    async def drop_redirect_cache(i):
+        sync_redis.delete(f"redirect:{code(i)}")
+
+    async def add_pending_clicks(i):
+        last_used = (datetime.utcnow() + timedelta(hours=3)).isoformat()
+        pipe = sync_redis.pipeline(transaction=False)
+        for j in range(100):
+            key = f"link_stats:{code(i * 100 + j)}"
+            pipe.hincrby(key, "hits", 1)
+            pipe.hset(key, "last_used", last_used)
+        pipe.execute()
+
+    async def redirect_miss(i):
+        await expect(await client.get(f"/links/{code(i)}"), 307)
+
+    async def redirect_hit(i):
+        await expect(await client.get(f"/links/{hot}"), 307)
+
+    async def shorten(i):
+        await expect(await client.post("/links/shorten", json={
+            "url": f"https://new.example.com/{run_id}/{i}",
+            "custom_alias": f"{run_id}n{i}",
+            "project": f"{run_id}-p{i % 10}"
+        }), 200)
+
+    async def stats_miss(i):
+        await expect(await client.get(f"/links/{code(i)}/stats"), 200)
+
+    async def stats_cached(i):
+        await expect(await client.get(f"/links/{hot}/stats"), 200)
+
+    async def stats_live(i):
+        await expect(await client.get(f"/links/{hot}/stats", params={"live": "true"}), 200)
+
+    async def project_stats(i):
+        await expect(await client.get(f"/projects/{run_id}-p{i % 10}/stats"), 200)
+
+    async def top_links(i):
+        await expect(await client.get("/links/top", params={"window": "hour"}), 200)
+
+    async def search_domain(i):
+        await expect(await client.get("/links/search/urls", params={"domain": f"site{i % 100}.example.com"}), 200)
+
+    async def search_substring(i):
+        await expect(await client.get("/links/search/urls", params={"q": f"page/{i % size}"}), 200)
+
+    async def celery_update_link_stats(i):
+        tasks.update_link_stats()
+
+    async def celery_deactivate_links(i):
+        tasks.check_and_deactivate_links()
+
+    async def embedded_update_link_stats(i):
+        await embedded.update_link_stats()
+
+    return [
+        Scenario("redirect_miss", redirect_miss, drop_redirect_cache),
+        Scenario("redirect_hit", redirect_hit),
+        Scenario("shorten", shorten),
+        Scenario("stats_miss", stats_miss),
+        Scenario("stats_cached", stats_cached),
+        Scenario("stats_live", stats_live),
+        Scenario("project_stats", project_stats),
+        Scenario("top_links", top_links),
+        Scenario("search_domain", search_domain),
+        Scenario("search_substring", search_substring),
+        Scenario("task_update_link_stats", celery_update_link_stats, add_pending_clicks),
+        Scenario("task_deactivate_links", celery_deactivate_links),
+        Scenario("embedded_update_link_stats", embedded_update_link_stats, add_pending_clicks),
+    ]
+
+
+async def measure(scenario: Scenario, counter, iterations: int, warmup: int, alloc_iterations: int) -> dict:
+    async def step(record):
+        i = next(counter)
+        if scenario.setup is not None:
+            await scenario.setup(i)
+        return await record(i)
+
+    async def timed(i):
+        started = time.perf_counter()
+        await scenario.call(i)
+        return time.perf_counter() - started
+
+    async def traced(i):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        await scenario.call(i)
+        return tracemalloc.get_traced_memory()[1] - base
+
+    for _ in range(warmup):
+        await step(timed)
+
+    latencies = [await step(timed) for _ in range(iterations)]
+
+    tracemalloc.start()
+    try:
+        allocations = [await step(traced) for _ in range(alloc_iterations)]
+    finally:
+        tracemalloc.stop()
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "ops_per_sec": iterations / sum(latencies),
+        "mean_ms": statistics.fmean(latencies) * 1e3,
+        "p50_ms": quantiles[49] * 1e3,
+        "p95_ms": quantiles[94] * 1e3,
+        "p99_ms": quantiles[98] * 1e3,
+        "alloc_kib": statistics.fmean(allocations) / 1024 if allocations else 0.0,
+    }
+
+
+# Для каждой метрики - направление, в котором она ухудшается
+REGRESSION_METRICS = {
+    "ops_per_sec": -1,
+    "p95_ms": 1,
+    "alloc_kib": 1,
+}
+
+
+def regressions(result: dict, base: dict, threshold: float) -> dict:
+    changes = {}
+    for metric, direction in REGRESSION_METRICS.items():
+        if not base.get(metric):
+            continue
+        change = result[metric] / base[metric] - 1
+        if change * direction > threshold:
+            changes[metric] = change
+    return changes
+
+
+def report(results: dict, baseline: dict | None, threshold: float) -> bool:
+    header = f"{'scenario':<28} {'ops/s':>9} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'KiB/call':>9}"
+    if baseline is not None:
+        header += f" {'ops':>6} {'p95':>6} {'alloc':>6}"
+    print(header)
+
+    regressed = False
+    for name, r in results.items():
+        line = (
+            f"{name:<28} {r['ops_per_sec']:>9.1f} {r['mean_ms']:>8.2f} {r['p50_ms']:>8.2f}"
+            f" {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['alloc_kib']:>9.1f}"
+        )
+        if baseline is not None and name in baseline:
+            base = baseline[name]
+            for metric in REGRESSION_METRICS:
+                change = r[metric] / base[metric] - 1 if base.get(metric) else 0.0
+                line += f" {change:>+6.0%}"
+            changes = regressions(r, base, threshold)
+            if changes:
+                line += "  REGRESSION: " + ", ".join(changes)
+                regressed = True
+        print(line)
+    return regressed
+
+
+async def run(args) -> dict:
+    import fakeredis
+    import fakeredis.aioredis
+    import httpx
+
+    from main import app
+    from src.database import get_redis, engine
+    from src.tasks import tasks, embedded
+
+    fake_server = fakeredis.FakeServer()
+    async_redis = fakeredis.aioredis.FakeRedis(server=fake_server)
+
+    app.dependency_overrides[get_redis] = lambda: async_redis
+    embedded.redis_client = async_redis
+    tasks.get_redis_conn = lambda: fakeredis.FakeRedis(server=fake_server)
+
+    run_id = f"r{int(time.time()) % 100000}x"
+    seed(args.size, run_id)
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for scenario in build_scenarios(client, fake_server, args.size, run_id):
+            if args.only and scenario.name not in args.only:
+                continue
+            results[scenario.name] = await measure(
+                scenario, itertools.count(), args.iterations, args.warmup, args.alloc_iterations
+            )
+            print(f"  {scenario.name}: done", file=sys.stderr)
+
+    await engine.dispose()
+    tasks.engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=10000, help="number of seeded links")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--alloc-iterations", type=int, default=50)
+    parser.add_argument("--only", nargs="*", help="run only these scenarios")
+    parser.add_argument("--save-baseline", type=Path)
+    parser.add_argument("--compare", type=Path, help="baseline JSON to compare ops/sec, p95 and allocations against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative worsening of ops/sec, p95 and KiB/call vs baseline")
+    args = parser.parse_args()
+
+    postgres = None
+    database_url = os.getenv("BENCH_DATABASE_URL")
+    if database_url:
+        db_env = env_from_url(database_url)
+    else:
+        postgres = EphemeralPostgres()
+        db_env = postgres.start()
+
+    try:
+        # Переменные окружения должны быть заданы до импорта src.config
+        os.environ.update(db_env)
+        os.environ.setdefault("REDIS_HOST", "127.0.0.1")
+        os.environ.setdefault("REDIS_PORT", "6379")
+        results = asyncio.run(run(args))
+    finally:
+        if postgres is not None:
+            postgres.stop()
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    regressed = report(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(results, indent=2))
+
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import AsyncGenerator
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import async_session_maker
+from src.config import (
+    DB_POOL_SIZE, DB_MAX_OVERFLOW,
+    ADMISSION_BUDGET_REDIRECT, ADMISSION_BUDGET_INTERACTIVE, ADMISSION_BUDGET_REPORTING,
+    ADMISSION_DEGRADED_WAIT, ADMISSION_RETRY_AFTER
+)
+
+
+class Priority(IntEnum):
+    REDIRECT = 0
+    INTERACTIVE = 1
+    REPORTING = 2
+
+
+# Ограничивает число одновременных обращений к БД размером пула. Запросы с низким
+# приоритетом могут занимать только часть слотов, а при деградации БД отчетные
+# запросы сразу получают 503 вместо ожидания в очереди пула.
+class AdmissionController:
+    def __init__(self, limit: int, shares: dict, budgets: dict, degraded_wait: float, retry_after: int):
+        self.limit = limit
+        self.shares = shares
+        self.budgets = budgets
+        self.degraded_wait = degraded_wait
+        self.retry_after = retry_after
+        self.in_use = 0
+        self._wait_ewma = 0.0
+        self._updated_at = time.monotonic()
+        self._cond = asyncio.Condition()
+
+    @property
+    def degraded(self) -> bool:
+        return self._current_wait(time.monotonic()) > self.degraded_wait
+
+    def _current_wait(self, now: float) -> float:
+        # Оценка затухает со временем, иначе после сброса отчетных запросов
+        # ей нечем было бы обновиться и деградация не закончилась бы
+        return self._wait_ewma * 0.5 ** (now - self._updated_at)
+
+    def _reject(self, priority: Priority):
+        return HTTPException(
+            status_code=503,
+            detail=f"Service overloaded, {priority.name.lower()} requests are shed",
+            headers={"Retry-After": str(self.retry_after)}
+        )
+
+    def _record_wait(self, wait: float) -> None:
+        now = time.monotonic()
+        self._wait_ewma = 0.8 * self._current_wait(now) + 0.2 * wait
+        self._updated_at = now
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority):
+        if priority == Priority.REPORTING and self.degraded:
+            raise self._reject(priority)
+
+        capacity = max(1, int(self.limit * self.shares[priority]))
+        started = time.monotonic()
+        async with self._cond:
+            try:
+                await asyncio.wait_for(
+                    self._cond.wait_for(lambda: self.in_use < capacity),
+                    self.budgets[priority]
+                )
+            except asyncio.TimeoutError:
+                self._record_wait(self.budgets[priority])
+                raise self._reject(priority)
+            self.in_use += 1
+        self._record_wait(time.monotonic() - started)
+
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.in_use -= 1
+                self._cond.notify_all()
+
+
+admission = AdmissionController(
+    limit=DB_POOL_SIZE + DB_MAX_OVERFLOW,
+    shares={
+        Priority.REDIRECT: 1.0,
+        Priority.INTERACTIVE: 0.8,
+        Priority.REPORTING: 0.5,
+    },
+    budgets={
+        Priority.REDIRECT: ADMISSION_BUDGET_REDIRECT,
+        Priority.INTERACTIVE: ADMISSION_BUDGET_INTERACTIVE,
+        Priority.REPORTING: ADMISSION_BUDGET_REPORTING,
+    },
+    degraded_wait=ADMISSION_DEGRADED_WAIT,
+    retry_after=ADMISSION_RETRY_AFTER
+)
+
+
+def admitted_session(priority: Priority):
+    async def dependency() -> AsyncGenerator[AsyncSession, None]:
+        async with admission.slot(priority):
+            async with async_session_maker() as session:
+                yield session
+
+    return dependency
@@ -0,0 +1,122 @@
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from src.config import REDIRECT_CACHE_MAX_AGE
+from src.schemas import LinkInfoResponse
+
+PERMANENT_REDIRECTS = (301, 308)
+DEFAULT_REDIRECT = 307
+CACHE_TTL = 600
+
+
+def cache_deadline_ms(expires_at: datetime | None) -> int | None:
+    # Время в БД хранится без часового пояса как UTC+3, а PXAT ждет unix-время в мс
+    deadline = datetime.now(timezone.utc) + timedelta(seconds=CACHE_TTL)
+    if expires_at is not None:
+        expires_utc = (expires_at - timedelta(hours=3)).replace(tzinfo=timezone.utc)
+        deadline = min(deadline, expires_utc)
+
+    if deadline <= datetime.now(timezone.utc):
+        return None
+    return int(deadline.timestamp() * 1000)
+
+
+def stats_cache_value(response: LinkInfoResponse, expires_at: datetime | None, generation: int) -> str:
+    return json.dumps({
+        "info": json.loads(response.json()),
+        "expires_at": expires_at.isoformat() if expires_at else None,
+        "generation": generation
+    })
+
+
+def parse_stats_cache(raw: bytes | str) -> tuple[LinkInfoResponse, int | None]:
+    data = json.loads(raw)
+    # Значения, записанные до появления поколений, считаются устаревшими
+    if "info" not in data:
+        return LinkInfoResponse.parse_obj(data), None
+
+    response = LinkInfoResponse.parse_obj(data["info"])
+    if data["expires_at"] and response.is_active:
+        expires_at = datetime.fromisoformat(data["expires_at"])
+        if expires_at <= datetime.utcnow() + timedelta(hours=3):
+            response = response.copy(update={"is_active": False})
+    return response, data.get("generation")
+
+
+def apply_stats_delta(
+    raw: bytes | str,
+    hits: int,
+    last_used: datetime,
+    generation: int,
+    new_generation: int
+) -> str | None:
+    # Снимок, прочитанный из БД в поколении generation, дополняется перенесенными
+    # в БД переходами - так же, как их применяет APPLY_LINK_STATS_STMT
+    data = json.loads(raw)
+    if "info" not in data or data["generation"] != generation:
+        return None
+
+    response = LinkInfoResponse.parse_obj(data["info"])
+    last_usage = response.last_usage
+    if last_usage is None or last_used > last_usage:
+        last_usage = last_used
+    response = response.copy(update={"cnt_usage": response.cnt_usage + hits, "last_usage": last_usage})
+
+    expires_at = datetime.fromisoformat(data["expires_at"]) if data["expires_at"] else None
+    return stats_cache_value(response, expires_at, new_generation)
+
+
+def redirect_cache_value(
+    url: str,
+    redirect_code: int | None,
+    expires_at: datetime | None,
+    project_id: int | None
+) -> str:
+    return json.dumps({
+        "url": url,
+        "code": redirect_code or DEFAULT_REDIRECT,
+        "expires_at": expires_at.isoformat() if expires_at else None,
+        "project_id": project_id
+    })
+
+
+def parse_redirect_cache(raw: bytes | str) -> tuple[str, int, datetime | None, int | None]:
+    if isinstance(raw, bytes):
+        raw = raw.decode()
+    # Значения, записанные до появления политик редиректа, хранят только URL
+    if not raw.startswith("{"):
+        return raw, DEFAULT_REDIRECT, None, None
+
+    data = json.loads(raw)
+    expires_at = datetime.fromisoformat(data["expires_at"]) if data["expires_at"] else None
+    return data["url"], data["code"], expires_at, data.get("project_id")
+
+
+def redirect_headers(redirect_code: int, expires_at: datetime | None) -> dict[str, str]:
+    if redirect_code not in PERMANENT_REDIRECTS:
+        return {}
+
+    max_age = REDIRECT_CACHE_MAX_AGE
+    if expires_at is not None:
+        remaining = (expires_at - (datetime.utcnow() + timedelta(hours=3))).total_seconds()
+        max_age = max(0, min(max_age, int(remaining)))
+
+    return {"Cache-Control": f"public, max-age={max_age}"}
+
+
+def etag_response(request: Request, payload: BaseModel) -> Response:
+    body = payload.json().encode()
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -9,6 +9,37 @@ DB_PASS = os.getenv("DB_PASS")
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+# Кэш подготовленных выражений asyncpg на каждое соединение (в SQLAlchemy по умолчанию 100, 0 - отключен)
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", 500))
 
 REDIS_HOST = os.getenv("REDIS_HOST")
-REDIS_PORT = os.getenv("REDIS_PORT")
\ No newline at end of file
+REDIS_PORT = os.getenv("REDIS_PORT")
+
+# Максимальный срок кэширования постоянных (301/308) редиректов браузером/CDN, сек
+REDIRECT_CACHE_MAX_AGE = int(os.getenv("REDIRECT_CACHE_MAX_AGE", 86400))
+# Учет переходов через POST /links/{short_code}/beacon при кэшировании редиректов на edge
+CLICK_BEACON_ENABLED = os.getenv("CLICK_BEACON_ENABLED", "false").lower() == "true"
+# Размер пачки для массовых операций над ссылками
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 500))
+
+# Допуск запросов к БД: сколько секунд запрос каждого приоритета может ждать слот
+ADMISSION_BUDGET_REDIRECT = float(os.getenv("ADMISSION_BUDGET_REDIRECT", 1.0))
+ADMISSION_BUDGET_INTERACTIVE = float(os.getenv("ADMISSION_BUDGET_INTERACTIVE", 2.0))
+ADMISSION_BUDGET_REPORTING = float(os.getenv("ADMISSION_BUDGET_REPORTING", 0.2))
+# Среднее ожидание слота, после которого БД считается деградировавшей, сек
+ADMISSION_DEGRADED_WAIT = float(os.getenv("ADMISSION_DEGRADED_WAIT", 0.05))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", 5))
+
+# Переходов за последний час (с учетом затухания), после которых редирект кэшируется
+HOT_LINK_CACHE_SCORE = float(os.getenv("HOT_LINK_CACHE_SCORE", 3))
+
+# Где выполняются фоновые задачи: "celery" (worker + beat) или "embedded" (asyncio в приложении)
+BACKGROUND_MODE = os.getenv("BACKGROUND_MODE", "celery")
+STATS_FLUSH_INTERVAL = float(os.getenv("STATS_FLUSH_INTERVAL", 60))
+DEACTIVATE_INTERVAL = float(os.getenv("DEACTIVATE_INTERVAL", 60))
+# Время жизни блокировки лидера; лидер продлевает ее каждую треть этого времени,
+# в том числе во время выполнения задачи
+BACKGROUND_LOCK_TIMEOUT = float(os.getenv("BACKGROUND_LOCK_TIMEOUT", 10))
\ No newline at end of file
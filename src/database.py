@@ -1,15 +1,28 @@
 from typing import AsyncGenerator
+from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
+from config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_PREPARED_STATEMENT_CACHE_SIZE
+from config import REDIS_HOST, REDIS_PORT
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_async_engine(DATABASE_URL)
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    connect_args={"prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE}
+)
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
+# Один пул соединений Redis на процесс для запросов и фоновых задач
+redis_client = Redis.from_url(f"redis://{REDIS_HOST}:{REDIS_PORT}")
+
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
 
-        
\ No newline at end of file
+
+async def get_redis() -> Redis:
+    return redis_client
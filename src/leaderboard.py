@@ -0,0 +1,94 @@
+import math
+import time
+
+from redis.asyncio import Redis
+
+# Рейтинг самых популярных ссылок хранится в sorted set с экспоненциальным
+# затуханием (forward decay): переход в момент t добавляет exp((t - L) / tau),
+# где L - опорная точка ключа. Сортировка по такому счету совпадает с сортировкой
+# по числу переходов, взвешенных по давности, поэтому топ читается одним
+# ZREVRANGE за O(log n + N). Чтобы счет не переполнялся, опорная точка
+# сдвигается каждые PERIOD_TAUS * tau секунд, а во второй половине периода
+# переходы пишутся и в ключ следующего периода.
+
+WINDOWS = {
+    "hour": 3600,
+    "day": 86400,
+}
+PERIOD_TAUS = 24
+# Сколько лучших ссылок хранится в каждом ключе: с запасом больше максимального
+# limit в /top, чтобы ссылки у границы успевали подняться, а память и стоимость
+# записи не росли с числом ссылок, по которым переходили за период
+TOP_SIZE = 1000
+
+
+def _landmark(now: float, tau: int) -> int:
+    period = tau * PERIOD_TAUS
+    return int(now // period) * period
+
+
+def _key(scope: str, window: str, landmark: int) -> str:
+    return f"top:{scope}:{window}:{landmark}"
+
+
+def _scopes(project_id: int | None) -> list[str]:
+    scopes = ["global"]
+    if project_id is not None:
+        scopes.append(f"project:{project_id}")
+    return scopes
+
+
+def add_click(pipe, short_code: str, project_id: int | None, now: float | None = None) -> None:
+    # Команды добавляются в уже открытый pipeline учета переходов.
+    # Первой идет ZINCRBY глобального часового рейтинга - по ее результату
+    # get_info решает, стоит ли прогревать кэш редиректа
+    now = time.time() if now is None else now
+    for window, tau in WINDOWS.items():
+        period = tau * PERIOD_TAUS
+        landmark = _landmark(now, tau)
+        landmarks = [landmark]
+        if now - landmark > period / 2:
+            landmarks.append(landmark + period)
+
+        for point in landmarks:
+            weight = math.exp((now - point) / tau)
+            for scope in _scopes(project_id):
+                key = _key(scope, window, point)
+                pipe.zincrby(key, weight, short_code)
+                pipe.zremrangebyrank(key, 0, -(TOP_SIZE + 1))
+                pipe.expireat(key, point + 2 * period)
+
+
+def remove_links(pipe, links: list[tuple[str, int | None]], now: float | None = None) -> None:
+    # Удаленные и истекшие ссылки убираются из текущего и следующего периода,
+    # иначе они оставались бы в рейтинге до полного затухания
+    now = time.time() if now is None else now
+    for window, tau in WINDOWS.items():
+        landmark = _landmark(now, tau)
+        for point in (landmark, landmark + tau * PERIOD_TAUS):
+            for short_code, project_id in links:
+                for scope in _scopes(project_id):
+                    pipe.zrem(_key(scope, window, point), short_code)
+
+
+def decayed_score(raw_score: float, window: str, now: float | None = None) -> float:
+    now = time.time() if now is None else now
+    tau = WINDOWS[window]
+    return raw_score / math.exp((now - _landmark(now, tau)) / tau)
+
+
+async def top_links(
+    redis: Redis,
+    window: str,
+    limit: int,
+    project_id: int | None = None
+) -> list[tuple[str, float]]:
+    now = time.time()
+    scope = "global" if project_id is None else f"project:{project_id}"
+    key = _key(scope, window, _landmark(now, WINDOWS[window]))
+
+    rows = await redis.zrevrange(key, 0, limit - 1, withscores=True)
+    return [
+        (code.decode() if isinstance(code, bytes) else code, decayed_score(score, window, now))
+        for code, score in rows
+    ]
@@ -0,0 +1,103 @@
+from datetime import datetime
+
+from src.cache import apply_stats_delta
+
+# Перенос переходов из Redis в БД общий для Celery-задачи и embedded-режима.
+# Здесь только разбор ключей и команды, которые добавляются в уже открытый
+# pipeline, а выполняют их (синхронно или через asyncio) вызывающие.
+#
+# На время переноса счетчики link_stats:{code} переименовываются в
+# link_stats_inflight:{code}, и live-статистика складывает оба ключа, пока
+# переход не попал в БД. Поколение stats_gen:{code} нечетно, пока идет перенос:
+# снимок stats:{code} из БД помечается четным поколением, в котором был прочитан,
+# и после коммита дополняется перенесенными переходами, а не удаляется.
+
+PENDING_TTL = 3600
+
+
+def codes_from_keys(keys) -> list[str]:
+    return [
+        (key.decode() if isinstance(key, bytes) else key).split(":", 1)[1]
+        for key in keys
+    ]
+
+
+def snapshot_is_current(cached_generation: int | None, generation: int) -> bool:
+    # Во время переноса снимок предыдущего поколения еще не содержит забранных
+    # переходов, поэтому вместе с link_stats_inflight дает точное значение
+    if cached_generation is None:
+        return False
+    return cached_generation == generation or (generation % 2 == 1 and cached_generation == generation - 1)
+
+
+def _finished_generation(generation: int) -> int:
+    # Если прошлый перенос прервался и оставил поколение нечетным, после queue_take
+    # оно четное - тогда четность восстанавливается шагом на 2
+    return generation + 1 if generation % 2 == 1 else generation + 2
+
+
+def queue_take(pipe, codes: list[str]) -> None:
+    # Выполняется в MULTI с raise_on_error=False: ключ мог истечь после SCAN,
+    # тогда RENAME вернет ошибку, а HGETALL - пустой словарь
+    for code in codes:
+        pipe.rename(f"link_stats:{code}", f"link_stats_inflight:{code}")
+        pipe.hgetall(f"link_stats_inflight:{code}")
+        pipe.incr(f"stats_gen:{code}")
+        pipe.expire(f"stats_gen:{code}", PENDING_TTL)
+
+
+def taken_params(codes: list[str], results: list) -> tuple[list[dict], dict[str, int]]:
+    # Параметры для APPLY_LINK_STATS_STMT и поколения ссылок во время переноса
+    params = []
+    for code, stats in zip(codes, results[1::4]):
+        if not isinstance(stats, dict):
+            continue
+        hits = int(stats.get(b"hits", 0))
+        last_used_str = stats.get(b"last_used")
+        if hits > 0 and last_used_str:
+            params.append({
+                "b_short": code,
+                "b_hits": hits,
+                "b_last_used": datetime.fromisoformat(last_used_str.decode())
+            })
+    generations = {code: int(generation) for code, generation in zip(codes, results[2::4])}
+    return params, generations
+
+
+def queue_restore(pipe, codes: list[str], params: list[dict]) -> None:
+    # Перенос не закоммичен: счетчики возвращаются в link_stats:{code}, а поколение -
+    # к значению до queue_take, так как БД не изменилась и снимки остаются верными
+    for item in params:
+        key = f"link_stats:{item['b_short']}"
+        pipe.hincrby(key, "hits", item["b_hits"])
+        pipe.hsetnx(key, "last_used", item["b_last_used"].isoformat())
+        pipe.expire(key, PENDING_TTL)
+    for code in codes:
+        pipe.delete(f"link_stats_inflight:{code}")
+        pipe.decr(f"stats_gen:{code}")
+
+
+def queue_finish(
+    pipe,
+    codes: list[str],
+    params: list[dict],
+    generations: dict[str, int],
+    snapshots: list | None = None
+) -> None:
+    # snapshots - значения stats:{code} для params, прочитанные под WATCH.
+    # Снимок поколения до переноса дополняется переходами и получает новое
+    # поколение, остальные снимки становятся недействительными сами
+    for item, raw in zip(params, snapshots or []):
+        if not raw:
+            continue
+        generation = generations[item["b_short"]]
+        if generation % 2 == 0:
+            continue
+        updated = apply_stats_delta(
+            raw, item["b_hits"], item["b_last_used"], generation - 1, _finished_generation(generation)
+        )
+        if updated is not None:
+            pipe.set(f"stats:{item['b_short']}", updated, keepttl=True)
+    for code in codes:
+        pipe.delete(f"link_stats_inflight:{code}")
+        pipe.incrby(f"stats_gen:{code}", _finished_generation(generations[code]) - generations[code])
@@ -1,10 +1,13 @@
+import asyncio
+
 from fastapi import FastAPI
 from router import router
 from projects_router import projects_router
 from redis.asyncio import Redis
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
-from src.config import REDIS_HOST, REDIS_PORT
+from src.config import REDIS_HOST, REDIS_PORT, BACKGROUND_MODE
+from src.tasks.embedded import run_background_jobs
 
 import uvicorn
 
@@ -20,6 +23,21 @@ async def startup():
     )
     FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
 
+    # Фоновые задачи без Celery: выполняются в приложении, лидер выбирается через Redis
+    if BACKGROUND_MODE == "embedded":
+        app.state.background_jobs = asyncio.create_task(run_background_jobs())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    background_jobs = getattr(app.state, "background_jobs", None)
+    if background_jobs is not None:
+        background_jobs.cancel()
+        try:
+            await background_jobs
+        except asyncio.CancelledError:
+            pass
+
 app.include_router(router)
 app.include_router(projects_router)
 
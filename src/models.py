@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from sqlalchemy import Column, String, TIMESTAMP, Boolean, Integer, ForeignKey
+from sqlalchemy import Column, String, TIMESTAMP, Boolean, Integer, ForeignKey, Index, func
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -12,13 +12,29 @@ class Link(Base):
     short = Column(String, nullable=False)  
     created_at = Column(TIMESTAMP, default=lambda: datetime.utcnow() + timedelta(hours=3))
     last_usage = Column(TIMESTAMP, nullable=True)
-    cnt_usage = Column(Integer, default=0)
+    cnt_usage = Column(Integer, default=0, server_default="0", nullable=False)
     expires_at = Column(TIMESTAMP, nullable=True)
     project_id = Column(Integer, ForeignKey('projects.id'))
     deleted = Column(Boolean, default=False)
+    redirect_code = Column(Integer, default=307)
+    domain = Column(String, nullable=True)
 
     project = relationship("Project", back_populates="project_links")
 
+    __table_args__ = (
+        # Триграммный индекс для поиска подстроки в url, когда совпадений мало (расширение pg_trgm)
+        Index("ix_links_url_trgm", "url", postgresql_using="gin", postgresql_ops={"url": "gin_trgm_ops"}),
+        # Обход ссылок в порядке выдачи поиска (по переходам), с keyset-пагинацией
+        Index("ix_links_clicks", cnt_usage.desc(), id.desc()),
+        Index("ix_links_domain_clicks", "domain", cnt_usage.desc(), id.desc()),
+        Index("ix_links_project_clicks", "project_id", cnt_usage.desc(), id.desc()),
+        # Поиск по поддоменам: суффикс домена становится префиксом перевернутой строки
+        Index(
+            "ix_links_domain_reversed", func.reverse(domain).label("domain_reversed"),
+            postgresql_ops={"domain_reversed": "text_pattern_ops"}
+        ).ddl_if(dialect="postgresql"),
+    )
+
 
 class Project(Base):
     __tablename__ = "projects"
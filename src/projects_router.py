@@ -1,12 +1,17 @@
 from datetime import datetime, timedelta
+from typing import Literal
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from redis.asyncio import Redis
 from sqlalchemy import and_, or_, select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_async_session
-from models import Link, Project
-from schemas import ProjectStatsResponse
+from src.admission import admitted_session, Priority
+from src.models import Link, Project
+from src.schemas import ProjectStatsResponse, TopLinkResponse
+from src.cache import etag_response
+from src.leaderboard import top_links
+from src.database import get_redis
 
 projects_router = APIRouter(
     prefix="/projects",
@@ -15,8 +20,9 @@ projects_router = APIRouter(
 
 @projects_router.get("/{project_name}/stats", response_model=ProjectStatsResponse)
 async def get_project_stats(
+    request: Request,
     project_name: str,
-    session: AsyncSession = Depends(get_async_session)
+    session: AsyncSession = Depends(admitted_session(Priority.REPORTING))
 ):
 
     project = await session.scalar(
@@ -51,11 +57,32 @@ async def get_project_stats(
         )
     ))
 
-    return ProjectStatsResponse(
+    return etag_response(request, ProjectStatsResponse(
         name=project.name,
         started_at=project.started_at,
         finished_at=project.finished_at,
         total_links=total_links,
         active_links=active_links,
         total_clicks=total_clicks
-    )
\ No newline at end of file
+    ))
+
+
+@projects_router.get("/{project_name}/top", response_model=list[TopLinkResponse])
+async def get_project_top_links(
+    project_name: str,
+    window: Literal["hour", "day"] = Query("hour"),
+    limit: int = Query(10, ge=1, le=100),
+    session: AsyncSession = Depends(admitted_session(Priority.INTERACTIVE)),
+    redis: Redis = Depends(get_redis)
+):
+    project_id = await session.scalar(
+        select(Project.id)
+        .where(Project.name == project_name)
+    )
+    if project_id is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    return [
+        TopLinkResponse(short_code=code, score=score)
+        for code, score in await top_links(redis, window, limit, project_id)
+    ]
@@ -0,0 +1,209 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, bindparam, exists, func, not_, or_, select, tuple_, update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models import Link, Project
+
+# Запросы горячих путей собираются один раз при импорте, а значения передаются
+# через bindparam. Выбираются только нужные колонки таблицы (Core), поэтому
+# не создаются ORM-объекты и не используется identity map сессии. Одинаковый
+# текст SQL позволяет asyncpg переиспользовать подготовленные выражения.
+
+links = Link.__table__
+projects = Project.__table__
+
+REDIRECT_STMT = (
+    select(links.c.url, links.c.cnt_usage, links.c.expires_at, links.c.redirect_code, links.c.project_id)
+    .where(
+        and_(
+            links.c.short == bindparam("short_code"),
+            links.c.deleted.is_(False),
+            or_(
+                links.c.expires_at > bindparam("now"),
+                links.c.expires_at.is_(None)
+            )
+        )
+    )
+)
+
+ALIAS_EXISTS_STMT = select(
+    exists().where(
+        and_(
+            links.c.short == bindparam("short_code"),
+            links.c.deleted.is_(False)
+        )
+    )
+)
+
+SEARCH_STMT = (
+    select(links.c.short)
+    .where(
+        and_(
+            links.c.url == bindparam("url"),
+            links.c.deleted.is_(False),
+            or_(
+                links.c.expires_at > bindparam("now"),
+                links.c.expires_at.is_(None)
+            )
+        )
+    )
+    .limit(1)
+)
+
+LINK_STATS_STMT = (
+    select(
+        links.c.url,
+        links.c.created_at,
+        links.c.last_usage,
+        links.c.cnt_usage,
+        projects.c.name,
+        links.c.deleted,
+        links.c.expires_at
+    )
+    .select_from(links.outerjoin(projects, links.c.project_id == projects.c.id))
+    .where(links.c.short == bindparam("short_code"))
+)
+
+# Сколько первых по рейтингу ссылок просматривает поиск, прежде чем перейти к
+# триграммному индексу (см. search_links_stmt)
+SEARCH_SCAN_ROWS = 10000
+
+
+def search_links_stmt(
+    query: str | None,
+    domain: str | None,
+    include_subdomains: bool,
+    project: str | None,
+    active: bool | None,
+    now: datetime,
+    limit: int,
+    after: tuple[int, int] | None,
+    scan_rows: int | None = None
+):
+    # Результаты упорядочены по числу переходов (cnt_usage DESC, id DESC), пагинация
+    # keyset: after - ключ последней строки предыдущей страницы.
+    #
+    # Ссылки обходятся по индексу в порядке выдачи (ix_links_domain_clicks для точного
+    # домена, ix_links_project_clicks для проекта, иначе ix_links_clicks), а остальные
+    # условия - подстрока, поддомены, активность - проверяются одним из двух способов:
+    # - scan_rows задан: только на первых scan_rows строках обхода. Это быстро,
+    #   когда совпадений много, и точно, если страница набралась;
+    # - scan_rows=None: по триграммному индексу и индексу перевернутого домена,
+    #   с сортировкой найденного. Это быстро, когда совпадений мало.
+    # Вызывающий начинает с первого способа и переходит ко второму, если страница
+    # не набралась
+    walk = [links.c.domain == domain] if domain and not include_subdomains else []
+    if project:
+        # id проекта подставляется до обхода, чтобы шел ix_links_project_clicks
+        walk.append(links.c.project_id == select(projects.c.id).where(projects.c.name == project).scalar_subquery())
+    if after is not None:
+        walk.append(tuple_(links.c.cnt_usage, links.c.id) < tuple_(after[0], after[1]))
+
+    rows = (
+        select(
+            links.c.short,
+            links.c.url,
+            links.c.domain,
+            projects.c.name,
+            links.c.cnt_usage,
+            links.c.created_at,
+            links.c.deleted,
+            links.c.expires_at,
+            links.c.id
+        )
+        .select_from(links.outerjoin(projects, links.c.project_id == projects.c.id))
+        .where(and_(*walk))
+    )
+
+    def filters(c):
+        conditions = []
+        if domain and include_subdomains:
+            # reverse(domain) LIKE 'moc.elpmaxe.%' обслуживается индексом ix_links_domain_reversed
+            conditions.append(or_(
+                c.domain == domain,
+                func.reverse(c.domain).startswith(("." + domain)[::-1], autoescape=True)
+            ))
+        if query:
+            conditions.append(c.url.contains(query, autoescape=True))
+        if active is not None:
+            is_active = and_(
+                c.deleted.is_(False),
+                or_(
+                    c.expires_at > now,
+                    c.expires_at.is_(None)
+                )
+            )
+            conditions.append(is_active if active else not_(is_active))
+        return conditions
+
+    if scan_rows is not None:
+        source = rows.order_by(links.c.cnt_usage.desc(), links.c.id.desc()).limit(scan_rows).subquery("head")
+    else:
+        source = rows.subquery("walk")
+    conditions = filters(source.c)
+
+    if scan_rows is None and conditions:
+        # MATERIALIZED не дает планировщику снова выбрать обход в порядке выдачи:
+        # до этого способа доходят, только когда совпадений мало
+        source = select(source).where(and_(*conditions)).cte("matches").prefix_with("MATERIALIZED")
+        conditions = []
+
+    return (
+        select(source)
+        .where(and_(*conditions))
+        .order_by(source.c.cnt_usage.desc(), source.c.id.desc())
+        .limit(limit)
+    )
+
+
+# Выполняется через executemany: по набору параметров на каждую ссылку
+APPLY_LINK_STATS_STMT = (
+    update(links)
+    .where(links.c.short == bindparam("b_short"))
+    .values(
+        cnt_usage=links.c.cnt_usage + bindparam("b_hits"),
+        last_usage=func.greatest(links.c.last_usage, bindparam("b_last_used"))
+    )
+)
+
+
+def deactivate_links_stmt(now: datetime):
+    three_days_ago = now - timedelta(days=3)
+    return (
+        update(links)
+        .where(
+            and_(
+                links.c.deleted.is_(False),
+                or_(
+                    links.c.expires_at < now,
+                    links.c.last_usage < three_days_ago,
+                    and_(
+                        links.c.last_usage.is_(None),
+                        links.c.created_at < three_days_ago
+                    )
+                )
+            )
+        )
+        .values(deleted=True)
+        .returning(links.c.short, links.c.project_id)
+    )
+
+
+async def fetch_redirect(session: AsyncSession, short_code: str, now: datetime) -> Row | None:
+    result = await session.execute(REDIRECT_STMT, {"short_code": short_code, "now": now})
+    return result.first()
+
+
+async def alias_exists(session: AsyncSession, short_code: str) -> bool:
+    return bool(await session.scalar(ALIAS_EXISTS_STMT, {"short_code": short_code}))
+
+
+async def search_short_code(session: AsyncSession, url: str, now: datetime) -> str | None:
+    return await session.scalar(SEARCH_STMT, {"url": url, "now": now})
+
+
+async def fetch_link_stats(session: AsyncSession, short_code: str) -> Row | None:
+    result = await session.execute(LINK_STATS_STMT, {"short_code": short_code})
+    return result.first()
@@ -1,45 +1,51 @@
 from datetime import datetime, timedelta
+from typing import Literal
+from urllib.parse import urlsplit
 import hashlib
 
-from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response
 from fastapi.responses import RedirectResponse
 from redis.asyncio import Redis
-from sqlalchemy import and_, or_, select, update
+from sqlalchemy import and_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import exists
 
-from src.database import get_async_session
+from src.database import get_async_session, get_redis
+from src.admission import admission, admitted_session, Priority
+from src.link_stats import snapshot_is_current
+from src.queries import fetch_redirect, alias_exists, search_short_code, fetch_link_stats, search_links_stmt, SEARCH_SCAN_ROWS
 from src.models import Link, Project
-from src.schemas import ShortenRequest, UpdateUrlRequest, LinkInfoResponse, StatusResponse, SearchQuery, ShortResponse, LinkDeletedResponse
-from src.config import REDIS_HOST, REDIS_PORT
+from src.schemas import ShortenRequest, UpdateUrlRequest, LinkInfoResponse, StatusResponse, SearchQuery, ShortResponse, LinkDeletedResponse, BulkDeleteRequest, BulkUpdateRequest, BulkItemResult, BulkResponse, TopLinkResponse, LinkSearchItem, LinkSearchPage
+from src.config import CLICK_BEACON_ENABLED, BULK_CHUNK_SIZE, HOT_LINK_CACHE_SCORE
+from src.leaderboard import add_click, decayed_score, top_links, remove_links
+from src.cache import (
+    redirect_cache_value, parse_redirect_cache, redirect_headers, etag_response,
+    cache_deadline_ms, stats_cache_value, parse_stats_cache, PERMANENT_REDIRECTS
+)
+
 
+# Алиасы, совпадающие со статическими путями /links/..., были бы недоступны для редиректа
+RESERVED_ALIASES = {"shorten", "search", "deleted", "top", "bulk"}
 
 router = APIRouter(
     prefix="/links",
     tags=["Links"]
 )
 
-async def get_redis() -> Redis:
-    return Redis.from_url(f"redis://{REDIS_HOST}:{REDIS_PORT}")
-
 @router.post("/shorten", response_model = ShortResponse)
 async def make_short_link(
     request: ShortenRequest, 
-    session: AsyncSession = Depends(get_async_session)
+    session: AsyncSession = Depends(admitted_session(Priority.INTERACTIVE))
 ):
     normalized_url = request.url.strip().rstrip("/").lower()
     # Проверка кастомного алиаса
     if request.custom_alias:
         short_url = request.custom_alias
+        if short_url in RESERVED_ALIASES:
+            raise HTTPException(409, "Alias is reserved")
         async with session.begin():
-            alias_exists = await session.scalar(
-                select(Link).where(
-                    and_(
-                        Link.short == short_url,
-                        Link.deleted.is_(False)
-                ))
-            )
-        if alias_exists:
+            alias_taken = await alias_exists(session, short_url)
+        if alias_taken:
             raise HTTPException(409, "Alias already exists")
     
     else:
@@ -48,14 +54,7 @@ async def make_short_link(
             short_hash = hashlib.sha256(request.url.encode()).hexdigest()[:6]
             short_url = short_hash
             async with session.begin():
-                exists = await session.scalar(
-                    select(Link).where(
-                        and_(
-                            Link.short == short_url,
-                            Link.deleted.is_(False)
-                    )
-                ))
-                if not exists:
+                if not await alias_exists(session, short_url):
                     break
         else:
             raise HTTPException(500, "Failed to generate short URL")
@@ -81,10 +80,12 @@ async def make_short_link(
     async with session.begin():
         new_link = Link(
             url=normalized_url,
+            domain=_extract_domain(normalized_url),
             short=short_url,
             created_at=datetime.utcnow() + timedelta(hours=3) ,
             expires_at=request.expires_at,
-            project_id=project_id
+            project_id=project_id,
+            redirect_code=request.redirect_code
         )
         session.add(new_link)
         await session.flush()
@@ -95,27 +96,11 @@ async def make_short_link(
 @router.get("/search", response_model=ShortResponse)
 async def search_short(
     original_url: str = Query(..., title="Original URL", example="https://example.com"),
-    session: AsyncSession = Depends(get_async_session)
+    session: AsyncSession = Depends(admitted_session(Priority.INTERACTIVE))
 ):
     normalized_url = original_url.strip().rstrip("/").lower()
     
-    stmt = (
-        select(Link.short)
-        .where(
-            and_(
-                Link.url == normalized_url,
-                Link.deleted.is_(False),
-                or_(
-                    Link.expires_at > (datetime.utcnow() + timedelta(hours=3)),
-                    Link.expires_at.is_(None)
-                )
-            )
-        )
-        .limit(1)
-    )
-    
-    result = await session.execute(stmt)
-    short_code = result.scalar_one_or_none()
+    short_code = await search_short_code(session, normalized_url, datetime.utcnow() + timedelta(hours=3))
     
     if not short_code:
         raise HTTPException(status_code=404, detail="Short link not found or expired")
@@ -123,9 +108,81 @@ async def search_short(
     return ShortResponse(short_code=short_code)
 
 
+@router.get("/search/urls", response_model=LinkSearchPage)
+async def search_urls(
+    q: str | None = Query(None, min_length=3, max_length=2048, example="example.com/promo"),
+    domain: str | None = Query(None, max_length=255, example="example.com"),
+    include_subdomains: bool = Query(False),
+    project: str | None = Query(None, max_length=50),
+    active: bool | None = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="next_cursor из предыдущей страницы"),
+    session: AsyncSession = Depends(admitted_session(Priority.INTERACTIVE))
+):
+    if not q and not domain:
+        raise HTTPException(422, "Specify q or domain")
+
+    normalized_domain = _extract_domain(domain) if domain else None
+    if domain and normalized_domain is None:
+        raise HTTPException(422, "Invalid domain")
+
+    # Курсор - число переходов и id последней строки страницы
+    after = None
+    if cursor:
+        try:
+            clicks, link_id = cursor.split(":")
+            after = (int(clicks), int(link_id))
+        except ValueError:
+            raise HTTPException(422, "Invalid cursor")
+
+    now = datetime.utcnow() + timedelta(hours=3)
+    # Лишняя строка показывает, есть ли следующая страница, без COUNT по всей выборке.
+    # Сначала просматриваются первые по рейтингу ссылки, и только если страница
+    # не набралась (совпадений мало) - поиск по индексам с сортировкой найденного
+    params = (
+        q.strip().lower() if q else None,
+        normalized_domain, include_subdomains,
+        project, active, now, limit + 1, after
+    )
+    rows = (await session.execute(search_links_stmt(*params, scan_rows=SEARCH_SCAN_ROWS))).all()
+    if len(rows) <= limit:
+        rows = (await session.execute(search_links_stmt(*params))).all()
+
+    items = [
+        LinkSearchItem(
+            short=row.short,
+            url=row.url,
+            domain=row.domain,
+            project_name=row.name,
+            cnt_usage=row.cnt_usage,
+            created_at=row.created_at,
+            is_active=not row.deleted and (row.expires_at is None or row.expires_at > now)
+        )
+        for row in rows[:limit]
+    ]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = f"{last.cnt_usage}:{last.id}"
+
+    return LinkSearchPage(items=items, limit=limit, next_cursor=next_cursor)
+
+
+def _extract_domain(url: str) -> str | None:
+    # url - произвольная строка, а urlsplit падает, например, на "http://[abc"
+    try:
+        host = urlsplit(url if "://" in url else f"//{url}").hostname
+    except ValueError:
+        return None
+    if host and host.startswith("www."):
+        host = host[4:]
+    return host
+
+
 @router.get("/deleted", response_model=list[LinkDeletedResponse])
 async def get_deleted_links(
-    session: AsyncSession = Depends(get_async_session)
+    session: AsyncSession = Depends(admitted_session(Priority.REPORTING))
 ):
     result = await session.execute(
     select(
@@ -158,6 +215,142 @@ async def get_deleted_links(
         ))
     
     return response
+
+
+@router.get("/top", response_model=list[TopLinkResponse])
+async def get_top_links(
+    window: Literal["hour", "day"] = Query("hour"),
+    limit: int = Query(10, ge=1, le=100),
+    redis: Redis = Depends(get_redis)
+):
+    return [
+        TopLinkResponse(short_code=code, score=score)
+        for code, score in await top_links(redis, window, limit)
+    ]
+
+
+@router.post("/bulk/delete", response_model=BulkResponse)
+async def bulk_delete(
+    request: BulkDeleteRequest,
+    session: AsyncSession = Depends(admitted_session(Priority.INTERACTIVE)),
+    redis: Redis = Depends(get_redis)
+):
+    # Удаленная ссылка больше не нужна ни в одном из кэшей, включая несброшенную статистику
+    return await _bulk_apply(
+        request, {"deleted": True}, "deleted",
+        ("redirect", "stats", "link_stats"), session, redis,
+        drop_rankings=True
+    )
+
+
+@router.post("/bulk/update", response_model=BulkResponse)
+async def bulk_update(
+    request: BulkUpdateRequest,
+    session: AsyncSession = Depends(admitted_session(Priority.INTERACTIVE)),
+    redis: Redis = Depends(get_redis)
+):
+    normalized_url = request.url.strip().rstrip("/").lower()
+    return await _bulk_apply(
+        request, {"url": normalized_url, "domain": _extract_domain(normalized_url)}, "updated",
+        ("redirect", "stats"), session, redis
+    )
+
+
+async def _bulk_apply(
+    request: BulkDeleteRequest,
+    values: dict,
+    status: str,
+    cache_prefixes: tuple[str, ...],
+    session: AsyncSession,
+    redis: Redis,
+    drop_rankings: bool = False
+) -> BulkResponse:
+    if (request.codes is None) == (request.project is None):
+        raise HTTPException(422, "Specify either codes or project")
+
+    results = []
+
+    if request.codes is not None:
+        codes = list(dict.fromkeys(request.codes))
+        for i in range(0, len(codes), BULK_CHUNK_SIZE):
+            chunk = codes[i:i + BULK_CHUNK_SIZE]
+            result = await session.execute(
+                update(Link)
+                .where(
+                    and_(
+                        Link.short.in_(chunk),
+                        Link.deleted.is_(False)
+                ))
+                .values(**values)
+                .returning(Link.short, Link.project_id)
+                .execution_options(synchronize_session=False)
+            )
+            rows = result.all()
+            affected = {short for short, _ in rows}
+            await session.commit()
+            await _invalidate_cache(redis, affected, cache_prefixes, rows if drop_rankings else None)
+
+            results.extend(
+                BulkItemResult(short_code=code, status=status if code in affected else "not_found")
+                for code in chunk
+            )
+    else:
+        project_id = await session.scalar(
+            select(Project.id).where(Project.name == request.project))
+        if project_id is None:
+            raise HTTPException(404, "Project not found")
+
+        # Проект обходится пачками по возрастанию id, чтобы не держать длинную транзакцию
+        last_id = 0
+        while True:
+            chunk_ids = (
+                select(Link.id)
+                .where(
+                    and_(
+                        Link.project_id == project_id,
+                        Link.deleted.is_(False),
+                        Link.id > last_id
+                ))
+                .order_by(Link.id)
+                .limit(BULK_CHUNK_SIZE)
+            )
+            result = await session.execute(
+                update(Link)
+                .where(Link.id.in_(chunk_ids))
+                .values(**values)
+                .returning(Link.id, Link.short)
+                .execution_options(synchronize_session=False)
+            )
+            rows = result.all()
+            await session.commit()
+            if not rows:
+                break
+
+            await _invalidate_cache(
+                redis, [short for _, short in rows], cache_prefixes,
+                [(short, project_id) for _, short in rows] if drop_rankings else None
+            )
+            results.extend(BulkItemResult(short_code=short, status=status) for _, short in rows)
+            last_id = max(link_id for link_id, _ in rows)
+
+    return BulkResponse(processed=len(results), results=results)
+
+
+async def _invalidate_cache(
+    redis: Redis,
+    short_codes,
+    prefixes: tuple[str, ...] = ("redirect", "stats"),
+    ranked: list[tuple[str, int | None]] | None = None
+) -> None:
+    if not short_codes:
+        return
+
+    async with redis.pipeline(transaction=False) as pipe:
+        for code in short_codes:
+            pipe.delete(*(f"{prefix}:{code}" for prefix in prefixes))
+        if ranked:
+            remove_links(pipe, ranked)
+        await pipe.execute()
     
 
 @router.get("/{short_code}", response_class=RedirectResponse)
@@ -166,45 +359,88 @@ async def get_info(
     session: AsyncSession = Depends(get_async_session),
     redis: Redis = Depends(get_redis)
 ):
-    cached_url = await redis.get(f"redirect:{short_code}")
-    if cached_url:
-        return RedirectResponse(cached_url.decode(), status_code=307)
-
-    link = await session.scalar(
-        select(Link)
-        .where(
-            and_(
-                Link.short == short_code,
-                Link.deleted.is_(False),
-                or_(
-                    Link.expires_at > (datetime.utcnow() + timedelta(hours=3)),
-                    Link.expires_at.is_(None)
-                )
-            )
-        )
-    )
+    cached = await redis.get(f"redirect:{short_code}")
+    if cached:
+        url, redirect_code, expires_at, project_id = parse_redirect_cache(cached)
+        if not _counted_by_beacon(redirect_code):
+            await _count_click(redis, short_code, project_id)
+        return RedirectResponse(url, status_code=redirect_code, headers=redirect_headers(redirect_code, expires_at))
+
+    # Слот БД занимается только при промахе кэша, поэтому при деградации БД
+    # закэшированные редиректы продолжают обслуживаться
+    async with admission.slot(Priority.REDIRECT), session.begin():
+        link = await fetch_redirect(session, short_code, datetime.utcnow() + timedelta(hours=3))
 
     if not link:
         raise HTTPException(status_code=404, detail="Short link not found or expired")
 
-    await redis.hincrby(f"link_stats:{short_code}", "hits", 1)
-    await redis.hset(f"link_stats:{short_code}", "last_used", (datetime.utcnow() + timedelta(hours=3)).isoformat())
-    await redis.expire(f"link_stats:{short_code}", 3600)
-
-    if link.cnt_usage > 10:
-        await redis.setex(
-            f"redirect:{short_code}", 
-            600,  
-            link.url
+    redirect_code = link.redirect_code or 307
+    hot_score = 0.0
+    if not _counted_by_beacon(redirect_code):
+        hot_score = await _count_click(redis, short_code, link.project_id)
+    # Кэш прогревается и для ссылок, которые стали популярны после последнего сброса статистики.
+    # Запись живет не дольше expires_at, чтобы истекшая ссылка не продолжала редиректить
+    deadline = cache_deadline_ms(link.expires_at)
+    if deadline and (link.cnt_usage > 10 or hot_score >= HOT_LINK_CACHE_SCORE or admission.degraded):
+        await redis.set(
+            f"redirect:{short_code}",
+            redirect_cache_value(link.url, redirect_code, link.expires_at, link.project_id),
+            pxat=deadline
         )
 
-    return RedirectResponse(link.url, status_code=307)
+    return RedirectResponse(link.url, status_code=redirect_code, headers=redirect_headers(redirect_code, link.expires_at))
+
+
+@router.post("/{short_code}/beacon", status_code=204, response_class=Response)
+async def click_beacon(
+    short_code: str = Path(..., min_length=3, max_length=64),
+    session: AsyncSession = Depends(get_async_session),
+    redis: Redis = Depends(get_redis)
+):
+    # Переходы по редиректам, закэшированным в браузере или CDN, до сервиса не доходят
+    if not CLICK_BEACON_ENABLED:
+        raise HTTPException(status_code=404, detail="Click beacon is disabled")
+
+    cached = await redis.get(f"redirect:{short_code}")
+    if cached:
+        _, redirect_code, _, project_id = parse_redirect_cache(cached)
+    else:
+        async with admission.slot(Priority.INTERACTIVE), session.begin():
+            link = await fetch_redirect(session, short_code, datetime.utcnow() + timedelta(hours=3))
+        if not link:
+            raise HTTPException(status_code=404, detail="Short link not found or expired")
+        redirect_code, project_id = link.redirect_code or 307, link.project_id
+
+    # Временные редиректы (307) уже учтены в get_info
+    if _counted_by_beacon(redirect_code):
+        await _count_click(redis, short_code, project_id)
+    return Response(status_code=204)
+
+
+def _counted_by_beacon(redirect_code: int) -> bool:
+    # Постоянный редирект кэшируется браузером/CDN, поэтому при включенном beacon
+    # его переходы учитывает только beacon, иначе дошедший до сервиса переход
+    # был бы посчитан дважды
+    return CLICK_BEACON_ENABLED and redirect_code in PERMANENT_REDIRECTS
+
+
+async def _count_click(redis: Redis, short_code: str, project_id: int | None) -> float:
+    key = f"link_stats:{short_code}"
+    async with redis.pipeline(transaction=False) as pipe:
+        add_click(pipe, short_code, project_id)
+        pipe.hincrby(key, "hits", 1)
+        pipe.hset(key, "last_used", (datetime.utcnow() + timedelta(hours=3)).isoformat())
+        pipe.expire(key, 3600)
+        results = await pipe.execute()
+
+    # Первая команда pipeline - ZINCRBY глобального часового рейтинга
+    return decayed_score(float(results[0]), "hour")
 
 
 @router.delete("/{short_code}", response_model=StatusResponse)
 async def delete_short(
     short_code: str = Path(..., min_length=3, max_length=64),
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(admitted_session(Priority.INTERACTIVE)),
     redis: Redis = Depends(get_redis)  
 ):
     exists_query = await session.scalar(
@@ -218,16 +454,21 @@ async def delete_short(
     if not exists_query:
         raise HTTPException(404, "Short link doesn't exist")
     
-    await session.execute(
+    result = await session.execute(
         update(Link)
         .where(Link.short == short_code)
         .values(deleted=True)
+        .returning(Link.project_id)
+        .execution_options(synchronize_session=False)
     )
+    project_ids = set(result.scalars().all())
     await session.commit()
     
-    # Удаляем кэш
-    await redis.delete(f"redirect:{short_code}")  
-    await redis.delete(f"stats:{short_code}")    
+    # Удаляем кэш и ссылку из рейтингов
+    await _invalidate_cache(
+        redis, [short_code],
+        ranked=[(short_code, project_id) for project_id in project_ids]
+    )
     
     return StatusResponse(
         status="success",
@@ -239,7 +480,7 @@ async def delete_short(
 async def change_url(
     short_code: str,
     request_data: UpdateUrlRequest,
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(admitted_session(Priority.INTERACTIVE)),
     redis: Redis = Depends(get_redis)
     ):
     normalized_url = request_data.url.strip().rstrip("/").lower()
@@ -258,7 +499,7 @@ async def change_url(
     stmt = (
         update(Link)
         .where(Link.short == short_code)
-        .values(url=normalized_url)
+        .values(url=normalized_url, domain=_extract_domain(normalized_url))
         .execution_options(synchronize_session="fetch")
     )
     
@@ -266,8 +507,7 @@ async def change_url(
     await session.commit()
 
     # Удаляем кэш
-    await redis.delete(f"redirect:{short_code}")  
-    await redis.delete(f"stats:{short_code}")  
+    await _invalidate_cache(redis, [short_code])
     
     return StatusResponse(
         status="success",
@@ -278,33 +518,36 @@ async def change_url(
 
 @router.get("/{short_code}/stats", response_model=LinkInfoResponse)
 async def get_link_info(
+    request: Request,
     short_code: str,
+    live: bool = Query(False, description="Добавить к ответу переходы, еще не перенесенные в БД"),
     session: AsyncSession = Depends(get_async_session),
     redis: Redis = Depends(get_redis)
 ):
 
     cache_key = f"stats:{short_code}"
-    cached_data = await redis.get(cache_key)
-    
+
+    # Кэш, поколение статистики и (для live) несброшенные и переносимые в БД переходы
+    # читаются одной транзакцией Redis, чтобы не попасть между шагами переноса
+    generation_key = f"stats_gen:{short_code}"
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.get(cache_key)
+        pipe.get(generation_key)
+        if live:
+            pipe.hgetall(f"link_stats:{short_code}")
+            pipe.hgetall(f"link_stats_inflight:{short_code}")
+        results = await pipe.execute()
+
+    cached_data, generation = results[0], int(results[1] or 0)
+    pending = results[2:]
+
     if cached_data:
-        return LinkInfoResponse.parse_raw(cached_data)
+        cached, cached_generation = parse_stats_cache(cached_data)
+        if snapshot_is_current(cached_generation, generation):
+            return etag_response(request, _merge_pending_stats(cached, *pending))
 
-    async with session.begin():
-        result = await session.execute(
-            select(
-                Link.url,
-                Link.created_at,
-                Link.last_usage,
-                Link.cnt_usage,
-                Project.name,
-                Link.deleted,
-                Link.expires_at
-            )
-            .outerjoin(Project, Link.project_id == Project.id)
-            .where(Link.short == short_code)
-        )
-        
-        row = result.first()
+    async with admission.slot(Priority.REPORTING), session.begin():
+        row = await fetch_link_stats(session, short_code)
         if not row:
             raise HTTPException(status_code=404, detail="Link not found")
 
@@ -325,11 +568,35 @@ async def get_link_info(
             is_active=is_active
         )
 
-        if cnt_usage > 10:
-            await redis.setex(
+        # В кэше хранится только снимок из БД, дельты из Redis добавляются при чтении
+        # Снимок кэшируется, только если перенос в БД не шел во время чтения
+        # (поколение четное и не изменилось), иначе он мог уже включать переходы
+        deadline = cache_deadline_ms(expires_at)
+        if (
+            deadline and cnt_usage > 10 and generation % 2 == 0
+            and int(await redis.get(generation_key) or 0) == generation
+        ):
+            await redis.set(
                 cache_key,
-                600,
-                response.json()
+                stats_cache_value(response, expires_at, generation),
+                pxat=deadline
             )
 
-        return response
+        return etag_response(request, _merge_pending_stats(response, *pending))
+
+
+def _merge_pending_stats(response: LinkInfoResponse, *pending: dict) -> LinkInfoResponse:
+    hits = 0
+    last_usage = response.last_usage
+    for stats in pending:
+        hits += int(stats.get(b"hits", 0))
+        last_used_str = stats.get(b"last_used")
+        if last_used_str:
+            last_used = datetime.fromisoformat(last_used_str.decode())
+            if last_usage is None or last_used > last_usage:
+                last_usage = last_used
+
+    return response.copy(update={
+        "cnt_usage": response.cnt_usage + hits,
+        "last_usage": last_usage
+    })
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Literal, Optional
 from datetime import datetime
 
 class ShortenRequest(BaseModel):
@@ -19,11 +19,39 @@ class ShortenRequest(BaseModel):
         max_length=50,
         example="marketing"
     )
+    redirect_code: Literal[301, 307, 308] = Field(
+        307,
+        example=308
+    )
 
 class UpdateUrlRequest(BaseModel):
     url: str
 
 
+class BulkDeleteRequest(BaseModel):
+    codes: Optional[list[str]] = Field(
+        None,
+        max_length=10000,
+        example=["hse", "msu"]
+    )
+    project: Optional[str] = Field(
+        None,
+        max_length=50,
+        example="marketing"
+    )
+
+class BulkUpdateRequest(BulkDeleteRequest):
+    url: str = Field(..., example="https://example.com")
+
+class BulkItemResult(BaseModel):
+    short_code: str
+    status: Literal["deleted", "updated", "not_found"]
+
+class BulkResponse(BaseModel):
+    processed: int = Field(..., ge=0)
+    results: list[BulkItemResult]
+
+
 class LinkInfoResponse(BaseModel):
     url: str
     created_at: datetime
@@ -41,6 +69,26 @@ class LinkDeletedResponse(BaseModel):
     project_name: str | None
 
 
+class TopLinkResponse(BaseModel):
+    short_code: str
+    score: float = Field(..., ge=0)
+
+
+class LinkSearchItem(BaseModel):
+    short: str
+    url: str
+    domain: str | None
+    project_name: str | None
+    cnt_usage: int = Field(..., ge=0)
+    created_at: datetime
+    is_active: bool
+
+class LinkSearchPage(BaseModel):
+    items: list[LinkSearchItem]
+    limit: int
+    next_cursor: str | None
+
+
 class StatusResponse(BaseModel):
     status: str
     message: str
@@ -1,5 +1,5 @@
 from celery import Celery
-from src.config import REDIS_HOST, REDIS_PORT
+from src.config import REDIS_HOST, REDIS_PORT, STATS_FLUSH_INTERVAL, DEACTIVATE_INTERVAL
 
 celery = Celery(
     'tasks',
@@ -13,10 +13,10 @@ celery.conf.timezone = 'UTC'
 celery.conf.beat_schedule = {
     'update-stats': {
         'task': 'src.tasks.tasks.update_link_stats',
-        'schedule': 60.0,
+        'schedule': STATS_FLUSH_INTERVAL,
     },
     'deactivate-expired-links': {
         'task': 'src.tasks.tasks.check_and_deactivate_links',
-        'schedule': 60
+        'schedule': DEACTIVATE_INTERVAL
     },
 }
\ No newline at end of file
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from redis.exceptions import RedisError, WatchError
+
+from src.database import async_session_maker, redis_client
+from src.queries import APPLY_LINK_STATS_STMT, deactivate_links_stmt
+from src.leaderboard import remove_links
+from src.link_stats import codes_from_keys, queue_finish, queue_restore, queue_take, taken_params
+from src.config import STATS_FLUSH_INTERVAL, DEACTIVATE_INTERVAL, BACKGROUND_LOCK_TIMEOUT
+
+# Те же задачи, что и в src/tasks/tasks.py, но на asyncio внутри приложения:
+# без отдельных worker/beat, на общем async-движке и пуле Redis. Выполняет их
+# только одна реплика - та, что держит блокировку лидера в Redis.
+
+logger = logging.getLogger(__name__)
+
+LEADER_LOCK_KEY = "background-jobs:leader"
+
+
+class LeadershipLost(Exception):
+    pass
+
+
+async def check_and_deactivate_links():
+    now = datetime.utcnow() + timedelta(hours=3)
+
+    async with async_session_maker() as session, session.begin():
+        result = await session.execute(deactivate_links_stmt(now))
+        rows = result.all()
+
+    if rows:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for code, _ in rows:
+                pipe.delete(f"redirect:{code}", f"link_stats:{code}", f"stats:{code}")
+            remove_links(pipe, rows)
+            await pipe.execute()
+
+
+async def update_link_stats():
+    keys = [key async for key in redis_client.scan_iter(match="link_stats:*", count=1000)]
+    if not keys:
+        return
+
+    codes = codes_from_keys(keys)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        queue_take(pipe, codes)
+        params, generations = taken_params(codes, await pipe.execute(raise_on_error=False))
+
+    # Флаг ставится сразу после COMMIT: если задачу отменили из-за потери
+    # лидерства уже после него (например, при закрытии сессии), счетчики
+    # не возвращаются в Redis и не переносятся повторно
+    committed = not params
+    try:
+        if params:
+            async with async_session_maker() as session:
+                async with session.begin():
+                    await session.execute(APPLY_LINK_STATS_STMT, params)
+                committed = True
+    finally:
+        if committed:
+            await _finish_flush(codes, params, generations)
+        else:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                queue_restore(pipe, codes, params)
+                await pipe.execute()
+
+
+async def _finish_flush(codes, params, generations):
+    # Снимки stats:{code} читаются под WATCH: если их за это время удалили
+    # (PUT/DELETE) или перезаписали, они просто не обновляются
+    snapshot_keys = [f"stats:{item['b_short']}" for item in params]
+    async with redis_client.pipeline(transaction=True) as pipe:
+        try:
+            snapshots = None
+            if snapshot_keys:
+                await pipe.watch(*snapshot_keys)
+                snapshots = await pipe.mget(snapshot_keys)
+            pipe.multi()
+            queue_finish(pipe, codes, params, generations, snapshots)
+            await pipe.execute()
+        except WatchError:
+            queue_finish(pipe, codes, params, generations)
+            await pipe.execute()
+
+
+JOBS = [
+    (update_link_stats, STATS_FLUSH_INTERVAL),
+    (check_and_deactivate_links, DEACTIVATE_INTERVAL),
+]
+
+
+async def _run_as_leader(lock, job):
+    # Пока задача выполняется, блокировка продлевается из отдельной задачи: долгий
+    # UPDATE не должен позволить другой реплике стать лидером. Если продлить
+    # не удалось, задача отменяется, чтобы не работать параллельно с новым лидером
+    async def renew():
+        while True:
+            await asyncio.sleep(BACKGROUND_LOCK_TIMEOUT / 3)
+            await lock.reacquire()
+
+    job_task = asyncio.create_task(job())
+    renew_task = asyncio.create_task(renew())
+    try:
+        await asyncio.wait({job_task, renew_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        if not job_task.done():
+            job_task.cancel()
+        renew_task.cancel()
+        await asyncio.gather(job_task, renew_task, return_exceptions=True)
+
+    if job_task.cancelled():
+        raise LeadershipLost() from renew_task.exception()
+    return job_task.result()
+
+
+async def run_background_jobs():
+    loop = asyncio.get_running_loop()
+    lock = redis_client.lock(LEADER_LOCK_KEY, timeout=BACKGROUND_LOCK_TIMEOUT)
+    # Между задачами блокировка продлевается на каждом шаге, поэтому шаг короче ее времени жизни
+    tick = min(min(interval for _, interval in JOBS), BACKGROUND_LOCK_TIMEOUT / 3)
+    is_leader = False
+    last_run = {}
+
+    try:
+        while True:
+            try:
+                if is_leader:
+                    await lock.reacquire()
+                else:
+                    is_leader = await lock.acquire(blocking=False)
+            except RedisError:
+                if is_leader:
+                    logger.warning("Lost background jobs leadership")
+                is_leader = False
+
+            for job, interval in JOBS:
+                if not is_leader:
+                    break
+                if loop.time() - last_run.get(job, float("-inf")) >= interval:
+                    last_run[job] = loop.time()
+                    try:
+                        await _run_as_leader(lock, job)
+                    except LeadershipLost:
+                        logger.warning("Lost background jobs leadership during %s", job.__name__)
+                        is_leader = False
+                    except Exception:
+                        logger.exception("Background job %s failed", job.__name__)
+
+            await asyncio.sleep(tick)
+    finally:
+        if is_leader:
+            try:
+                await lock.release()
+            except RedisError:
+                pass
@@ -1,7 +1,9 @@
 from celery import shared_task
-from sqlalchemy import create_engine, update, and_, or_, func
+from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from src.models import Link, Base
+from src.queries import APPLY_LINK_STATS_STMT, deactivate_links_stmt
+from src.leaderboard import remove_links
+from src.link_stats import codes_from_keys, queue_finish, queue_restore, queue_take, taken_params
 from src.config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER, REDIS_HOST, REDIS_PORT
 from datetime import datetime, timedelta, timezone
 import redis
@@ -10,44 +12,29 @@ DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 engine = create_engine(DATABASE_URL)
 Session = sessionmaker(bind=engine)
 
+
+def get_redis_conn() -> redis.Redis:
+    return redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+
+
 @shared_task
 def check_and_deactivate_links():
     session = Session()
-    redis_conn = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+    redis_conn = get_redis_conn()
     try:
         now = datetime.utcnow() + timedelta(hours=3)
-        three_days_ago = now - timedelta(days=3)
-
-        condition = and_(
-            Link.deleted == False,
-            or_(
-                Link.expires_at < now,
-                or_(
-                    Link.last_usage < three_days_ago,
-                    and_(
-                        Link.last_usage.is_(None),
-                        Link.created_at < three_days_ago
-                    )
-                )
-            )
-        )
 
         # Обновляем записи и получаем short_code деактивированных ссылок
-        stmt = (
-            update(Link)
-            .where(condition)
-            .values(deleted=True)
-            .returning(Link.short)
-        )
-        result = session.execute(stmt)
-        short_codes = [row[0] for row in result]
+        result = session.execute(deactivate_links_stmt(now))
+        rows = result.all()
         session.commit()
 
         # Удаляем связанные ключи в Redis
-        for code in short_codes:
-            redis_conn.delete(f"redirect:{code}")
-            redis_conn.delete(f"link_stats:{code}")
-            redis_conn.delete(f"stats:{code}")
+        pipe = redis_conn.pipeline(transaction=False)
+        for code, _ in rows:
+            pipe.delete(f"redirect:{code}", f"link_stats:{code}", f"stats:{code}")
+        remove_links(pipe, rows)
+        pipe.execute()
 
     except Exception as e:
         session.rollback()
@@ -59,40 +46,58 @@ def check_and_deactivate_links():
 
 @shared_task
 def update_link_stats():
-    redis_conn = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+    redis_conn = get_redis_conn()
     session = Session()
     
     try:
         # Получаем все ключи статистики
         stats_keys = redis_conn.keys("link_stats:*")
-        
-        for key in stats_keys:
-            short_code = key.decode().split(":")[1]
-            stats = redis_conn.hgetall(key)
-            
-            if not stats:
-                continue
-
-            hits = int(stats.get(b'hits', 0))
-            last_used_str = stats.get(b'last_used')
-            last_used = datetime.fromisoformat(last_used_str.decode()) if last_used_str else None
+        if not stats_keys:
+            return
 
-            if hits > 0 and last_used:
-                # Обновляем БД
-                session.execute(
-                    update(Link)
-                    .where(Link.short == short_code)
-                    .values(
-                        cnt_usage=Link.cnt_usage + hits,
-                        last_usage=func.greatest(Link.last_usage, last_used)
-                    )
-                )
-                redis_conn.delete(key)
+        codes = codes_from_keys(stats_keys)
+        pipe = redis_conn.pipeline(transaction=True)
+        queue_take(pipe, codes)
+        params, generations = taken_params(codes, pipe.execute(raise_on_error=False))
 
-        session.commit()
+        # Обновляем БД одним executemany. Счетчики возвращаются в Redis,
+        # только если перенос не закоммичен, иначе они учлись бы дважды
+        committed = not params
+        try:
+            if params:
+                session.execute(APPLY_LINK_STATS_STMT, params)
+                session.commit()
+                committed = True
+        finally:
+            if committed:
+                _finish_flush(redis_conn, codes, params, generations)
+            else:
+                pipe = redis_conn.pipeline(transaction=True)
+                queue_restore(pipe, codes, params)
+                pipe.execute()
     except Exception as e:
         session.rollback()
         raise e
     finally:
         session.close()
-        redis_conn.close()
\ No newline at end of file
+        redis_conn.close()
+
+
+def _finish_flush(redis_conn, codes, params, generations):
+    # Снимки stats:{code} читаются под WATCH: если их за это время удалили
+    # (PUT/DELETE) или перезаписали, они просто не обновляются
+    snapshot_keys = [f"stats:{item['b_short']}" for item in params]
+    pipe = redis_conn.pipeline(transaction=True)
+    try:
+        snapshots = None
+        if snapshot_keys:
+            pipe.watch(*snapshot_keys)
+            snapshots = pipe.mget(snapshot_keys)
+        pipe.multi()
+        queue_finish(pipe, codes, params, generations, snapshots)
+        pipe.execute()
+    except redis.WatchError:
+        queue_finish(pipe, codes, params, generations)
+        pipe.execute()
+    finally:
+        pipe.reset()